@@ -0,0 +1,150 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import shapely
+
+# ========== CONFIGURABLE VARIABLES ==========
+CHUNK_BLOCKS = 2000        # Straddling blocks per overlay task
+MIN_SHARE = 0.001          # Block pieces below this share of the block are treated as slivers
+# ============================================
+
+
+# ---------- OVERLAY WORKERS ----------
+def _intersection_areas(task):
+    """Worker: areas of block x precinct intersections for one spatial chunk."""
+    block_wkb, precinct_wkb, block_pos, precinct_pos = task
+    blocks = shapely.from_wkb(block_wkb)
+    precincts = shapely.from_wkb(precinct_wkb)
+    return shapely.area(shapely.intersection(blocks[block_pos], precincts[precinct_pos]))
+
+
+def _chunk_tasks(block_geoms, precinct_geoms, pair_block, pair_precinct, chunk_blocks):
+    """
+    Group straddling blocks into spatially compact chunks with only the geometry each needs.
+
+    Blocks are ordered along a Hilbert curve of their centroids, so each chunk covers a
+    small area and ships a handful of precinct polygons instead of the whole state.
+    """
+    blocks = np.unique(pair_block)
+    rank = np.empty(len(blocks), dtype=np.int64)
+    rank[np.argsort(_hilbert_keys(shapely.centroid(block_geoms[blocks])), kind="stable")] = np.arange(len(blocks))
+
+    rank_of_pair = rank[np.searchsorted(blocks, pair_block)]
+    pair_order = np.argsort(rank_of_pair, kind="stable")
+    chunk_of_pair = rank_of_pair[pair_order] // chunk_blocks
+    bounds = np.searchsorted(chunk_of_pair, np.arange(chunk_of_pair[-1] + 2))
+
+    tasks, pair_slices = [], []
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        pairs = pair_order[start:stop]
+        chunk_blocks_idx, local_b = np.unique(pair_block[pairs], return_inverse=True)
+        chunk_precincts_idx, local_p = np.unique(pair_precinct[pairs], return_inverse=True)
+        tasks.append((
+            shapely.to_wkb(block_geoms[chunk_blocks_idx]),
+            shapely.to_wkb(precinct_geoms[chunk_precincts_idx]),
+            local_b, local_p,
+        ))
+        pair_slices.append(pairs)
+    return tasks, pair_slices
+
+
+def _hilbert_keys(points, level=16):
+    """Position of each point along a Hilbert curve over the points' bbox."""
+    x, y = shapely.get_x(points), shapely.get_y(points)
+    n = 2 ** level
+    span = max(np.ptp(x), np.ptp(y)) or 1.0
+    xi = ((x - x.min()) / span * (n - 1)).astype(np.int64)
+    yi = ((y - y.min()) / span * (n - 1)).astype(np.int64)
+    keys = np.zeros(len(xi), dtype=np.int64)
+    s = n // 2
+    while s > 0:
+        rx = ((xi & s) > 0).astype(np.int64)
+        ry = ((yi & s) > 0).astype(np.int64)
+        keys += s * s * ((3 * rx) ^ ry)
+        # Rotate the quadrant so the curve stays continuous
+        flip = (ry == 0) & (rx == 1)
+        xi, yi = np.where(flip, n - 1 - xi, xi), np.where(flip, n - 1 - yi, yi)
+        swap = ry == 0
+        xi, yi = np.where(swap, yi, xi), np.where(swap, xi, yi)
+        s //= 2
+    return keys
+
+
+# ---------- WEIGHTS ----------
+def block_precinct_weights(census_block, precinct, workers=None, chunk_blocks=CHUNK_BLOCKS):
+    """
+    Block -> precinct allocation weights as (block position, precinct position, weight) arrays.
+
+    Blocks covered by a single precinct, or touching only one, get weight 1 without any
+    overlay. Only blocks straddling several precincts are intersected, in spatial chunks
+    spread over worker processes. Each block's weights sum to 1 over the precincts it
+    overlaps, so block totals are conserved; blocks outside every precinct get no rows.
+    """
+    block_geoms = census_block.geometry.values
+    precinct_geoms = precinct.geometry.values
+    tree = shapely.STRtree(precinct_geoms)
+
+    covered_b, covered_p = tree.query(block_geoms, predicate="covered_by")
+    covered_b, first = np.unique(covered_b, return_index=True)
+    covered_p = covered_p[first]
+
+    rest = np.setdiff1d(np.arange(len(block_geoms)), covered_b)
+    pair_b, pair_p = tree.query(block_geoms[rest], predicate="intersects")
+    pair_b = rest[pair_b]
+    candidates = np.bincount(pair_b, minlength=len(block_geoms))
+    single = candidates[pair_b] == 1
+    straddling = ~single
+
+    block_pos = [covered_b, pair_b[single]]
+    precinct_pos = [covered_p, pair_p[single]]
+    weights = [np.ones(len(covered_b)), np.ones(single.sum())]
+
+    if straddling.any():
+        split_b, split_p = pair_b[straddling], pair_p[straddling]
+        tasks, pair_slices = _chunk_tasks(block_geoms, precinct_geoms, split_b, split_p, chunk_blocks)
+        areas = np.empty(len(split_b))
+        workers = workers or os.cpu_count() or 1
+        if workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+                results = pool.map(_intersection_areas, tasks)
+                for pairs, result in zip(pair_slices, results):
+                    areas[pairs] = result
+        else:
+            for pairs, task in zip(pair_slices, tasks):
+                areas[pairs] = _intersection_areas(task)
+
+        # Normalize by the overlapped area so a block's full value is allocated, dropping slivers
+        overlapped = np.bincount(split_b, weights=areas, minlength=len(block_geoms))
+        share = np.divide(areas, overlapped[split_b], out=np.zeros_like(areas), where=overlapped[split_b] > 0)
+        share = np.where(share < MIN_SHARE, 0.0, share)
+        kept = np.bincount(split_b, weights=share, minlength=len(block_geoms))
+        share = np.divide(share, kept[split_b], out=np.zeros_like(share), where=kept[split_b] > 0)
+        keep = share > 0
+
+        block_pos.append(split_b[keep])
+        precinct_pos.append(split_p[keep])
+        weights.append(share[keep])
+        print(f"Areal interpolation: {len(np.unique(split_b))} of {len(block_geoms)} blocks split across precincts")
+
+    return np.concatenate(block_pos), np.concatenate(precinct_pos), np.concatenate(weights)
+
+
+def aggregate_weighted(census_block, columns, weights, precinct_index):
+    """Sum block columns into precincts by allocation weights, rounded to whole counts."""
+    block_pos, precinct_pos, share = weights
+    values = census_block[columns].to_numpy(dtype="float64")[block_pos] * share[:, None]
+    totals = pd.DataFrame(values, columns=columns).groupby(precinct_pos).sum().round().astype("int64")
+    totals.index = precinct_index[totals.index]
+    return totals
+
+
+def dominant_assignment(weights, census_block, precinct_index):
+    """Precinct holding the largest share of each block, shaped like ``maup.assign`` output."""
+    block_pos, precinct_pos, share = weights
+    order = np.lexsort((-share, block_pos))
+    blocks, first = np.unique(block_pos[order], return_index=True)
+    assignment = pd.Series(np.nan, index=census_block.index, dtype=object)
+    assignment.iloc[blocks] = precinct_index[precinct_pos[order][first]]
+    return assignment
@@ -0,0 +1,154 @@
+import argparse
+import os
+
+import geopandas as gpd
+import maup
+import numpy as np
+import pandas as pd
+import shapely
+
+# ========== CONFIGURABLE VARIABLES ==========
+BLOCK_KEY = "GEOID20"          # Block GEOID column on the census block layer
+PRECINCT_KEY = "UNIQUE_ID"     # Precinct ID the equivalency file maps blocks to
+CHECK_SAMPLE = 5000            # Blocks re-checked spatially after the key join
+MAX_MISMATCH = 0.01            # Share of sampled blocks allowed outside their precinct
+MAX_UNMATCHED = 0.001          # Share of populated blocks allowed to be missing from the file
+# ============================================
+
+
+# ---------- EQUIVALENCY FILES ----------
+def read_equivalency(path):
+    """
+    Read a block -> precinct equivalency file as two string columns (BLOCK, PRECINCT).
+
+    Accepts the CSVs written by ``save_equivalency`` (first column block GEOID, second
+    precinct ID) and the Census Bureau's pipe-delimited VTD block assignment files
+    (BLOCKID|COUNTYFP|DISTRICT), whose state + county + district code is the VTD GEOID20.
+    """
+    with open(path) as f:
+        header = f.readline()
+    bef = pd.read_csv(path, sep="|" if "|" in header else ",", dtype=str)
+
+    if {"BLOCKID", "COUNTYFP", "DISTRICT"} <= set(bef.columns):
+        precinct_ids = bef["BLOCKID"].str[:2] + bef["COUNTYFP"] + bef["DISTRICT"]
+        return pd.DataFrame({"BLOCK": bef["BLOCKID"], "PRECINCT": precinct_ids})
+    return pd.DataFrame({"BLOCK": bef.iloc[:, 0], "PRECINCT": bef.iloc[:, 1]})
+
+
+def save_equivalency(census_block, precinct, assignment, path, block_key=BLOCK_KEY, precinct_key=PRECINCT_KEY):
+    """Save a spatial block -> precinct assignment so later runs can use the key join."""
+    assigned = assignment.notna()
+    bef = pd.DataFrame({
+        block_key: census_block.loc[assigned, block_key].to_numpy(),
+        precinct_key: precinct.loc[assignment[assigned], precinct_key].to_numpy(),
+    })
+    bef.to_csv(path, index=False)
+    return bef
+
+
+# ---------- KEY JOIN ----------
+def geoid_codes(values):
+    """Block GEOIDs as int64 join keys (15 digits fit comfortably); unparseable IDs become -1."""
+    return pd.to_numeric(pd.Series(values, copy=False), errors="coerce").fillna(-1).astype("int64").to_numpy()
+
+
+def assign_from_equivalency(census_block, precinct, bef, block_key=BLOCK_KEY, precinct_key=PRECINCT_KEY):
+    """
+    Block -> precinct assignment from an equivalency table, shaped like ``maup.assign``.
+
+    Both joins are integer ``get_indexer`` lookups: precinct IDs to precinct rows, then
+    block GEOIDs to equivalency rows. Blocks missing from the file are left unassigned.
+    """
+    precinct_ids = pd.Index(precinct[precinct_key].astype(str))
+    if not precinct_ids.is_unique:
+        raise ValueError(f"{precinct_key} is not unique on the precinct layer")
+    precinct_rows = precinct_ids.get_indexer(bef["PRECINCT"])
+
+    # A block listed twice keeps its first precinct
+    block_codes = geoid_codes(bef["BLOCK"])
+    first = ~pd.Index(block_codes).duplicated(keep="first")
+    rows = pd.Index(block_codes[first]).get_indexer(geoid_codes(census_block[block_key]))
+    precinct_rows = precinct_rows[first]
+
+    positions = np.where(rows >= 0, precinct_rows[rows], -1)
+    assignment = pd.Series(precinct.index.take(np.maximum(positions, 0)), index=census_block.index, dtype=object)
+    assignment[positions < 0] = np.nan
+    if (positions >= 0).all():
+        assignment = assignment.astype(precinct.index.dtype)
+    return assignment
+
+
+def spatial_mismatch(census_block, precinct, assignment, sample=CHECK_SAMPLE, seed=0):
+    """Share of a random sample of key-joined blocks whose interior point lies outside their precinct."""
+    assigned = np.flatnonzero(assignment.notna().to_numpy())
+    if not len(assigned):
+        return 1.0
+    rng = np.random.default_rng(seed)
+    picked = rng.choice(assigned, size=min(sample, len(assigned)), replace=False)
+
+    points = shapely.point_on_surface(census_block.geometry.values[picked])
+    targets = precinct.geometry.values[precinct.index.get_indexer(assignment.iloc[picked])]
+    return float(1 - shapely.covers(targets, points).mean())
+
+
+# ---------- PIPELINE ENTRY ----------
+def blocks_to_precincts(census_block, precinct, bef_path=None, block_key=BLOCK_KEY, precinct_key=PRECINCT_KEY):
+    """
+    Assign census blocks to precincts, preferring a block equivalency file.
+
+    With no path this is ``maup.assign``. If the path exists, blocks are assigned by key
+    join and a sample is checked spatially; too many mismatches or missing populated
+    blocks fall back to the spatial assignment. If the path does not exist yet, the
+    spatial assignment is saved there for the next run; if an existing file fails the
+    check it is left untouched (it may be an official Census file) and the spatial
+    assignment goes to ``<path>.derived.csv`` instead.
+    """
+    if bef_path is None:
+        return maup.assign(census_block, precinct)
+
+    def spatial_fallback(out_path):
+        assignment = maup.assign(census_block, precinct)
+        save_equivalency(census_block, precinct, assignment, out_path, block_key, precinct_key)
+        print(f"Saved block equivalency to {out_path}")
+        return assignment
+
+    if not os.path.exists(bef_path):
+        return spatial_fallback(bef_path)
+
+    try:
+        assignment = assign_from_equivalency(census_block, precinct, read_equivalency(bef_path), block_key, precinct_key)
+    except ValueError as exc:
+        print(f"Warning: {exc}, falling back to spatial assignment.")
+        return maup.assign(census_block, precinct)
+
+    populated = census_block["TOT_POP20"].to_numpy() > 0 if "TOT_POP20" in census_block.columns else np.ones(len(census_block), dtype=bool)
+    unmatched = float((assignment.isna().to_numpy() & populated).sum() / max(populated.sum(), 1))
+    mismatch = spatial_mismatch(census_block, precinct, assignment)
+    print(f"Block equivalency: {unmatched:.3%} populated blocks unmatched, {mismatch:.3%} of sampled blocks outside their precinct")
+
+    if unmatched > MAX_UNMATCHED or mismatch > MAX_MISMATCH:
+        derived_path = bef_path + ".derived.csv"
+        print(f"Warning: block equivalency does not match the precinct layer, falling back to spatial assignment. "
+              f"{bef_path} is left unchanged; point BLOCK_EQUIVALENCY_PATH at {derived_path} to reuse the result.")
+        return spatial_fallback(derived_path)
+    return assignment
+
+
+# ---------- MAIN ----------
+def main():
+    parser = argparse.ArgumentParser(description="Derive a block -> precinct equivalency file from a spatial assignment.")
+    parser.add_argument("blocks", help="Census block shapefile")
+    parser.add_argument("precincts", help="Precinct shapefile")
+    parser.add_argument("out_csv")
+    parser.add_argument("--precinct-key", default=PRECINCT_KEY)
+    args = parser.parse_args()
+
+    census_block = gpd.read_file(args.blocks).to_crs("EPSG:5070")
+    precinct = gpd.read_file(args.precincts).to_crs("EPSG:5070")
+    assignment = maup.assign(census_block, precinct)
+    bef = save_equivalency(census_block, precinct, assignment, args.out_csv, precinct_key=args.precinct_key)
+    print(f"\n=== Saved {len(bef)} block assignments to {args.out_csv} ===")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import argparse
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from precinct_constants import CVAP_COMPONENTS, FINAL_DIR, INCOME_COMPONENTS, RACE_COMPONENTS
+
+# ========== CONFIGURABLE VARIABLES ==========
+REPORT_DIR = "conservation_report"   # One Parquet file per state and run; read the folder as one report
+OUTLIER_PCT = 5.0                    # |Pct_Difference| flagged by the CLI
+# ============================================
+
+# Totals derived from the prorated components, per dataset
+DERIVED_TOTALS = {
+    "population": {"NHSP_POP23": RACE_COMPONENTS[1:], "TOT_POP23": RACE_COMPONENTS},
+    "cvap": {"NHSP_CVAP23": CVAP_COMPONENTS[1:], "TOT_CVAP23": CVAP_COMPONENTS},
+    "income": {"TOT_HOUS23": INCOME_COMPONENTS},
+}
+
+
+def new_run_id():
+    return datetime.now().strftime("%Y%m%dT%H%M%S")
+
+
+# ---------- TOTALS ----------
+def compare_totals(source, target, components, derived):
+    """
+    Source block group vs target precinct totals for one dataset.
+
+    Each frame is reduced once over its component columns; the derived totals
+    (NHSP, TOT) are sums of those component sums rather than extra per-row columns.
+    """
+    components = [c for c in components if c in source.columns]
+    source_totals = source[components].sum()
+    for name, parts in derived.items():
+        source_totals[name] = source_totals[[p for p in parts if p in components]].sum()
+
+    target_totals = target[list(source_totals.index)].sum()
+    differences = target_totals - source_totals
+    percent_diff = (differences / source_totals.replace(0, np.nan)) * 100
+
+    return pd.DataFrame({
+        "Source_ACS_BG": source_totals,
+        "Target_Precinct": target_totals,
+        "Difference": differences,
+        "Pct_Difference": percent_diff.round(8)
+    })
+
+
+def comparison_rows(state, run_id, comparisons):
+    """Long-format rows for the consolidated report, one per (dataset, column)."""
+    frames = []
+    for dataset, comparison in comparisons.items():
+        frame = comparison.reset_index(names="Column")
+        frame.insert(0, "Dataset", dataset)
+        frames.append(frame)
+    rows = pd.concat(frames, ignore_index=True)
+    rows.insert(0, "Run", run_id)
+    rows.insert(0, "State", state)
+    rows["Pct_Difference"] = pd.to_numeric(rows["Pct_Difference"], errors="coerce")
+    for col in ["Source_ACS_BG", "Target_Precinct", "Difference"]:
+        rows[col] = pd.to_numeric(rows[col]).astype("float64")
+    return rows
+
+
+def append_report(state, run_id, comparisons, report_dir=None):
+    """
+    Add this run's totals to the report folder, replacing any earlier copy of the same state and run.
+
+    Each state and run gets its own file, so concurrent state runs never rewrite each
+    other's rows. The file is staged under a dot-name (skipped by Parquet readers) and
+    moved into place once complete.
+    """
+    report_dir = report_dir or os.path.join(FINAL_DIR, REPORT_DIR)
+    os.makedirs(report_dir, exist_ok=True)
+    rows = comparison_rows(state, run_id, comparisons)
+    path = os.path.join(report_dir, f"{state}_{run_id}.parquet")
+    staging = os.path.join(report_dir, f".{state}_{run_id}.parquet.tmp")
+    rows.to_parquet(staging, index=False)
+    os.replace(staging, path)
+    return rows
+
+
+# ---------- PER-PRECINCT RESIDUALS ----------
+def precinct_residuals(census_block, source, b_to_bg, b_to_prec, columns, precinct_index):
+    """
+    Attribute each block group's lost value to the precincts its blocks fall in.
+
+    A block group loses value when its blocks carry no weight for a category or when
+    rounding block estimates drops counts. The loss is spread over precincts by the
+    block group's 2020 population share (block count when it has no population).
+    Values on blocks outside every precinct, and block groups with no blocks at all,
+    are reported under ``UNASSIGNED``.
+    """
+    bg_codes = pd.Index(source.index).get_indexer(b_to_bg)
+    has_bg = bg_codes >= 0
+    bg_codes = np.where(has_bg, bg_codes, 0)
+
+    population = census_block["TOT_POP20"].to_numpy(dtype="float64") if "TOT_POP20" in census_block.columns else np.ones(len(census_block))
+    bg_population = np.bincount(bg_codes[has_bg], weights=population[has_bg], minlength=len(source))
+    bg_blocks = np.bincount(bg_codes[has_bg], minlength=len(source))
+    share = np.where(
+        bg_population[bg_codes] > 0,
+        population / np.where(bg_population[bg_codes] > 0, bg_population[bg_codes], 1),
+        1 / np.maximum(bg_blocks[bg_codes], 1),
+    ) * has_bg
+
+    prec_codes = pd.Index(precinct_index).get_indexer(b_to_prec)
+    unassigned = prec_codes < 0
+    prec_codes = np.where(unassigned, len(precinct_index), prec_codes)
+
+    residuals = {}
+    for col in columns:
+        block_values = census_block[col].to_numpy(dtype="float64")
+        kept = np.bincount(bg_codes[has_bg], weights=block_values[has_bg], minlength=len(source))
+        lost = source[col].to_numpy(dtype="float64") - kept
+        block_loss = lost[bg_codes] * share
+        # Block values stranded outside every precinct are lost as well
+        block_loss = block_loss + np.where(unassigned, block_values, 0)
+        resid = np.bincount(prec_codes, weights=block_loss, minlength=len(precinct_index) + 1)
+        resid[-1] += lost[bg_blocks == 0].sum()
+        residuals[f"{col}_RESID"] = resid
+
+    index = list(precinct_index) + ["UNASSIGNED"]
+    return pd.DataFrame(residuals, index=index).round(3)
+
+
+# ---------- MAIN ----------
+def main():
+    parser = argparse.ArgumentParser(description="Show data-loss outliers from the consolidated conservation report.")
+    parser.add_argument("--report", default=os.path.join(FINAL_DIR, REPORT_DIR))
+    parser.add_argument("--state", nargs="*", help="Limit to these states")
+    parser.add_argument("--all-runs", action="store_true", help="Include every run, not only the latest per state")
+    parser.add_argument("--threshold", type=float, default=OUTLIER_PCT, help="Flag |Pct_Difference| above this")
+    args = parser.parse_args()
+
+    report = pd.read_parquet(args.report)
+    if args.state:
+        report = report[report["State"].isin(args.state)]
+    if not args.all_runs:
+        latest = report.groupby("State")["Run"].transform("max")
+        report = report[report["Run"] == latest]
+
+    outliers = report[report["Pct_Difference"].abs() > args.threshold]
+    outliers = outliers.reindex(outliers["Pct_Difference"].abs().sort_values(ascending=False).index)
+
+    pd.set_option("display.width", 200)
+    print(f"\n=== {len(outliers)} of {len(report)} totals differ by more than {args.threshold}% ===")
+    print(outliers.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import argparse
+import hashlib
+import json
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from geojson_writer import COORD_PRECISION, OUTPUT_CRS, dumps, write_geojson
+from precinct_constants import CVAP_COLUMNS, ELECTION_PATTERN, FINAL_DIR, INCOME_COLUMNS, RACE_COLUMNS
+
+# ========== CONFIGURABLE VARIABLES ==========
+BUNDLE_DIR = "bundles"            # Subdirectory of each state's output folder
+ID_COLUMNS = ["UNIQUE_ID", "GEOID20"]   # Kept on the geometry features so clicks resolve to a precinct
+HASH_LENGTH = 12                  # Hex digits of the content hash used in file names
+# ============================================
+
+ATTRIBUTE_GROUPS = {
+    "population": RACE_COLUMNS,
+    "cvap": CVAP_COLUMNS,
+    "income": INCOME_COLUMNS + ["MEDN_INC23"],
+}
+INT_TYPES = [pa.uint8(), pa.int8(), pa.uint16(), pa.int16(), pa.uint32(), pa.int32(), pa.int64()]
+
+
+# ---------- GROUPS ----------
+def attribute_groups(precinct):
+    """
+    Split attribute columns into bundles: one per election's votes, then population, CVAP, income.
+
+    Columns in none of these (other than IDs and geometry) go to an ``other`` bundle so
+    nothing in the source layer is dropped.
+    """
+    groups = {}
+    for col in precinct.columns:
+        match = ELECTION_PATTERN.match(col)
+        if match:
+            groups.setdefault(f"votes_{match.group(1)}", []).append(col)
+    for name, columns in ATTRIBUTE_GROUPS.items():
+        present = [c for c in columns if c in precinct.columns]
+        if present:
+            groups[name] = present
+
+    grouped = {c for columns in groups.values() for c in columns}
+    other = [c for c in precinct.columns if c not in grouped and c not in ID_COLUMNS and c != precinct.geometry.name]
+    if other:
+        groups["other"] = other
+    return groups
+
+
+# ---------- ENCODING ----------
+def compact_array(values):
+    """
+    One column as the narrowest Arrow type that holds it exactly.
+
+    Whole numbers (including whole-number floats, as counts often are after a GeoJSON
+    round trip) become the smallest fitting integer type, other floats stay float64, and
+    strings are dictionary-encoded. Missing values stay null.
+    """
+    mask = values.isna().to_numpy()
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        numbers = values.to_numpy(dtype="float64", na_value=np.nan)
+        present = numbers[~mask]
+        if np.all(np.isfinite(present)) and np.all(present == np.round(present)):
+            low, high = (present.min(), present.max()) if len(present) else (0, 0)
+            for kind in INT_TYPES:
+                info = np.iinfo(kind.to_pandas_dtype())
+                if info.min <= low and high <= info.max:
+                    filled = np.where(mask, 0, numbers).astype(kind.to_pandas_dtype())
+                    return pa.array(filled, type=kind, mask=mask)
+        return pa.array(numbers, type=pa.float64(), mask=mask)
+    return pa.array(values.astype(object).where(~mask, None).tolist()).dictionary_encode()
+
+
+def ipc_bytes(frame):
+    """Arrow IPC file bytes for a frame, rows in feature order."""
+    table = pa.table({col: compact_array(frame[col]) for col in frame.columns})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes(), table.schema
+
+
+def content_hash(data):
+    return hashlib.sha1(data).hexdigest()[:HASH_LENGTH]
+
+
+# ---------- BUNDLES ----------
+def write_geometry(precinct, out_dir, state, precision=COORD_PRECISION, compress=()):
+    """Write the geometry-only layer and rename it (and its compressed siblings) after its content hash."""
+    columns = [c for c in ID_COLUMNS if c in precinct.columns] + [precinct.geometry.name]
+    staging = os.path.join(out_dir, f"{state}_geometry.geojson")
+    write_geojson(precinct[columns], staging, precision, compress)
+
+    with open(staging, "rb") as f:
+        digest = content_hash(f.read())
+    name = f"{state}_geometry.{digest}.geojson"
+    for suffix in ["", ".gz", ".br"]:
+        if os.path.exists(staging + suffix):
+            os.replace(staging + suffix, os.path.join(out_dir, name + suffix))
+    return name, digest
+
+
+def write_bundles(precinct, out_dir, state, precision=COORD_PRECISION, compress=()):
+    """
+    Write a state's map data as one geometry layer plus per-group Arrow attribute bundles.
+
+    Every file name carries its content hash, so it can be served with a long cache
+    lifetime; only ``<state>_manifest.json`` changes between runs. Attribute rows follow
+    the geometry file's feature order. Files from the previous manifest that are no longer
+    referenced are removed once the new manifest is written, so a reader never finds the
+    manifest pointing at a deleted file.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    precinct = precinct.to_crs(OUTPUT_CRS).reset_index(drop=True)
+    manifest_path = os.path.join(out_dir, f"{state}_manifest.json")
+    previous = set()
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = set(json.load(f).get("files", []))
+
+    geometry_file, geometry_hash = write_geometry(precinct, out_dir, state, precision, compress)
+    manifest = {
+        "state": state,
+        "features": len(precinct),
+        "geometry": {"file": geometry_file, "hash": geometry_hash, "crs": OUTPUT_CRS, "ids": [c for c in ID_COLUMNS if c in precinct.columns]},
+        "attributes": {},
+    }
+
+    for group, columns in attribute_groups(precinct).items():
+        data, schema = ipc_bytes(pd.DataFrame(precinct[columns]))
+        name = f"{state}_{group}.{content_hash(data)}.arrow"
+        with open(os.path.join(out_dir, name), "wb") as f:
+            f.write(data)
+        manifest["attributes"][group] = {
+            "file": name,
+            "bytes": len(data),
+            "columns": {field.name: str(field.type) for field in schema},
+        }
+
+    files = [geometry_file] + [entry["file"] for entry in manifest["attributes"].values()]
+    manifest["files"] = files
+    staging = manifest_path + ".tmp"
+    with open(staging, "wb") as f:
+        f.write(dumps(manifest))
+    os.replace(staging, manifest_path)
+
+    for stale in previous - set(files):
+        for suffix in ["", ".gz", ".br"]:
+            if os.path.exists(os.path.join(out_dir, stale + suffix)):
+                os.remove(os.path.join(out_dir, stale + suffix))
+    return manifest
+
+
+# ---------- MAIN ----------
+def main():
+    parser = argparse.ArgumentParser(description="Export precinct layers as a geometry file plus Arrow attribute bundles for the web map.")
+    parser.add_argument("states", nargs="+")
+    parser.add_argument("--input", help="Layer to export (default: Final_precincts/<state>/<state>_precinct_all_pop.geojson; one state only)")
+    parser.add_argument("--out-dir", help="Output directory (default: Final_precincts/<state>/bundles)")
+    parser.add_argument("--precision", type=int, default=COORD_PRECISION)
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--brotli", action="store_true")
+    args = parser.parse_args()
+
+    if args.input and len(args.states) > 1:
+        parser.error("--input takes a single state")
+    compress = [kind for kind, on in (("gzip", args.gzip), ("brotli", args.brotli)) if on]
+    for state in args.states:
+        path = args.input or os.path.join(FINAL_DIR, state, f"{state}_precinct_all_pop.geojson")
+        out_dir = args.out_dir or os.path.join(FINAL_DIR, state, BUNDLE_DIR)
+        manifest = write_bundles(gpd.read_file(path), out_dir, state, args.precision, compress)
+
+        sizes = {name: os.path.getsize(os.path.join(out_dir, name)) for name in manifest["files"]}
+        print(f"\n=== {state}: {manifest['features']} features -> {out_dir} ===")
+        for name, size in sizes.items():
+            print(f"{name:<48}{size / 1e3:>10.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import argparse
+import gzip
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+try:
+    import orjson
+
+    def dumps(obj):
+        return orjson.dumps(obj)
+except ImportError:
+    import json
+
+    def dumps(obj):
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# ========== CONFIGURABLE VARIABLES ==========
+OUTPUT_CRS = "EPSG:4326"
+COORD_PRECISION = 6       # ~0.1 m at precinct latitudes, plenty for display and lookup
+CHUNK_SIZE = 2000         # Features encoded per batch
+# ============================================
+
+
+# ---------- SINKS ----------
+class _GzipFile:
+    """gzip stream without a file name or timestamp in its header, so equal content gives equal bytes."""
+
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.stream = gzip.GzipFile(filename="", mode="wb", compresslevel=9, fileobj=self.file, mtime=0)
+
+    def write(self, data):
+        self.stream.write(data)
+
+    def close(self):
+        self.stream.close()
+        self.file.close()
+
+
+class _BrotliFile:
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.compressor = brotli.Compressor(quality=9)
+
+    def write(self, data):
+        self.file.write(self.compressor.process(data))
+
+    def close(self):
+        self.file.write(self.compressor.finish())
+        self.file.close()
+
+
+def open_sinks(path, compress):
+    """
+    Open the plain output and its compressed siblings; returns (sinks, their final paths).
+
+    Each sink writes to ``<final path>.tmp`` so an existing file stays intact until the
+    new one is complete.
+    """
+    sinks, paths = [open(path + ".tmp", "wb")], [path]
+    for kind in compress:
+        if kind == "gzip":
+            sinks.append(_GzipFile(path + ".gz.tmp"))
+            paths.append(path + ".gz")
+        elif kind == "brotli":
+            if brotli is None:
+                print("Warning: brotli is not installed, skipping .br output.")
+                continue
+            sinks.append(_BrotliFile(path + ".br.tmp"))
+            paths.append(path + ".br")
+        else:
+            raise ValueError(f"Unknown compression: {kind}")
+    return sinks, paths
+
+
+# ---------- ENCODING ----------
+def normalize_columns(frame):
+    """
+    Settle each attribute column's JSON type over the whole frame.
+
+    Float columns holding only whole numbers become Int64, so they are written as integers;
+    deciding per column rather than per chunk keeps one type for every feature.
+    """
+    frame = frame.copy()
+    for col in frame.columns:
+        values = frame[col]
+        if pd.api.types.is_float_dtype(values):
+            present = values.dropna()
+            if len(present) and np.all(np.isfinite(present)) and np.all(present == np.round(present)):
+                frame[col] = values.round().astype("Int64")
+        elif pd.api.types.is_datetime64_any_dtype(values):
+            frame[col] = values.astype(str).where(values.notna())
+    return frame
+
+
+def property_columns(frame):
+    """Convert attribute columns to plain Python lists."""
+    columns = {}
+    for col in frame.columns:
+        values = frame[col].astype(object)
+        columns[col] = values.where(values.notna(), None).tolist()
+    return columns
+
+
+def encode_features(gdf, precision=COORD_PRECISION):
+    """Yield one encoded GeoJSON feature (bytes) per row of a frame already passed through ``normalize_columns``."""
+    geometries = gdf.geometry.values
+    if precision is not None:
+        geometries = shapely.transform(geometries, lambda coords: np.round(coords, precision))
+    geojson = shapely.to_geojson(geometries)
+
+    attributes = property_columns(pd.DataFrame(gdf.drop(columns=gdf.geometry.name)))
+    names = list(attributes)
+    for i, geom in enumerate(geojson):
+        props = dumps({name: attributes[name][i] for name in names})
+        geom = b"null" if geom is None else geom.encode()
+        yield b'{"type":"Feature","properties":' + props + b',"geometry":' + geom + b"}"
+
+
+# ---------- WRITER ----------
+class FeatureCollectionWriter:
+    """
+    Streams a GeoJSON FeatureCollection to disk one chunk at a time.
+
+    Only the chunk being encoded is held in memory, so large layers can be written
+    from an iterator of GeoDataFrames. Compressed siblings (``.gz`` / ``.br``) are
+    produced in the same pass for static hosting.
+    """
+
+    def __init__(self, path, precision=COORD_PRECISION, compress=(), crs=OUTPUT_CRS):
+        self.path = path
+        self.precision = precision
+        self.crs = crs
+        self.sinks, self.paths = open_sinks(path, compress)
+        self.first = True
+        self._write(b'{"type":"FeatureCollection","features":[')
+
+    def _write(self, data):
+        for sink in self.sinks:
+            sink.write(data)
+
+    def write(self, gdf, chunk_size=CHUNK_SIZE):
+        if self.crs is not None and gdf.crs is not None:
+            gdf = gdf.to_crs(self.crs)
+        gdf = normalize_columns(gdf)
+        for start in range(0, len(gdf), chunk_size):
+            features = list(encode_features(gdf.iloc[start:start + chunk_size], self.precision))
+            if not features:
+                continue
+            prefix = b"\n" if self.first else b",\n"
+            self._write(prefix + b",\n".join(features))
+            self.first = False
+
+    def close(self):
+        """Finish the collection and move the outputs into place, replacing any earlier files."""
+        self._write(b"\n]}\n")
+        for sink in self.sinks:
+            sink.close()
+        for path in self.paths:
+            os.replace(path + ".tmp", path)
+
+    def abort(self):
+        """Close and delete the partial outputs; files already at the final paths are left untouched."""
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception:
+                pass
+        for path in self.paths:
+            if os.path.exists(path + ".tmp"):
+                os.remove(path + ".tmp")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_geojson(gdf, path, precision=COORD_PRECISION, compress=(), chunk_size=CHUNK_SIZE):
+    with FeatureCollectionWriter(path, precision, compress) as writer:
+        writer.write(gdf, chunk_size)
+
+
+# ---------- MAIN ----------
+def main():
+    parser = argparse.ArgumentParser(description="Rewrite GeoJSON files with reduced coordinate precision and compressed siblings.")
+    parser.add_argument("inputs", nargs="+", help="GeoJSON files, e.g. simplified_maps/*.json")
+    parser.add_argument("--out-dir", help="Write here instead of replacing the inputs")
+    parser.add_argument("--precision", type=int, default=COORD_PRECISION)
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--brotli", action="store_true")
+    args = parser.parse_args()
+
+    compress = [kind for kind, on in (("gzip", args.gzip), ("brotli", args.brotli)) if on]
+    for path in args.inputs:
+        gdf = gpd.read_file(path)
+        out_path = os.path.join(args.out_dir, os.path.basename(path)) if args.out_dir else path
+        before = os.path.getsize(path)
+        write_geojson(gdf, out_path, args.precision, compress)
+        print(f"{path}: {before / 1e6:.2f} MB -> {os.path.getsize(out_path) / 1e6:.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
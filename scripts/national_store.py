@@ -0,0 +1,199 @@
+import argparse
+import os
+import shutil
+
+import geopandas as gpd
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from precinct_constants import ELECTION_PATTERN, FILTER_PATTERN, FINAL_DIR
+from summary_sidecars import count_columns, derived_metrics
+
+# ========== CONFIGURABLE VARIABLES ==========
+STORE_DIR = "national_precincts"   # Root of the Hive-partitioned GeoParquet dataset
+STORE_CRS = "EPSG:4326"
+ROW_GROUP_SIZE = 1000              # Precincts per row group; smaller groups prune more finely
+COMPRESSION = "zstd"
+# ============================================
+
+PARTITIONING = ds.partitioning(pa.schema([("state", pa.string()), ("election", pa.string())]), flavor="hive")
+FILTER_EXPRESSIONS = {
+    ">=": lambda f, v: f >= v, "<=": lambda f, v: f <= v, "!=": lambda f, v: f != v,
+    "=": lambda f, v: f == v, ">": lambda f, v: f > v, "<": lambda f, v: f < v,
+}
+
+
+# ---------- PUBLISH ----------
+def election_key(precinct):
+    """Election code (e.g. G24) from the vote columns, used as the election partition."""
+    codes = sorted({m.group(1) for m in map(ELECTION_PATTERN.match, precinct.columns) if m})
+    if len(codes) != 1:
+        raise ValueError(f"Expected vote columns from one election, found {codes or 'none'}")
+    return codes[0]
+
+
+def partition_path(state, election, root=STORE_DIR):
+    return os.path.join(root, f"state={state}", f"election={election}")
+
+
+def publish_state(precinct, state, election=None, root=STORE_DIR, row_group_size=ROW_GROUP_SIZE):
+    """
+    Write one state's precincts as a partition of the national store, replacing any earlier copy.
+
+    Rows are Hilbert-sorted so each row group covers a compact area, which keeps the
+    bbox covering columns' row-group statistics tight. Derived shares (HAR_MARGIN,
+    HSP_CVAP_PCT, ...) are stored as columns so cross-state filters prune on them too.
+    """
+    election = election or election_key(precinct)
+    precinct = precinct.to_crs(STORE_CRS)
+
+    # Counts are Int64 in every partition so state schemas unify
+    counts = count_columns(precinct)
+    precinct[counts] = precinct[counts].astype("Int64")
+    precinct = pd.concat([precinct, derived_metrics(precinct[counts].fillna(0).astype("int64"))], axis=1)
+    precinct = precinct.iloc[precinct.geometry.hilbert_distance().argsort(kind="stable")]
+
+    out_dir = partition_path(state, election, root)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+    precinct.to_parquet(
+        os.path.join(out_dir, "part-0.parquet"),
+        index=False,
+        write_covering_bbox=True,
+        row_group_size=row_group_size,
+        compression=COMPRESSION,
+    )
+    return out_dir
+
+
+# ---------- QUERY ----------
+def open_store(root=STORE_DIR):
+    """The national dataset with one schema unified across states (their columns can differ)."""
+    dataset = ds.dataset(root, format="parquet", partitioning=PARTITIONING)
+    schema = pa.unify_schemas([fragment.physical_schema for fragment in dataset.get_fragments()] + [PARTITIONING.schema], promote_options="permissive")
+    return ds.dataset(root, schema=schema, format="parquet", partitioning=PARTITIONING)
+
+
+def parse_where(clause):
+    """A ``COLUMN op value`` clause, as accepted by the precinct server, as a dataset expression."""
+    match = FILTER_PATTERN.match(clause)
+    if not match:
+        raise ValueError(f"Bad filter: {clause}")
+    column, op, value = match.groups()
+    try:
+        value = float(value)
+    except ValueError:
+        pass
+    return FILTER_EXPRESSIONS[op](pc.field(column), value)
+
+
+def build_filter(where=(), bbox=None, states=None, elections=None):
+    """
+    Combine partition, attribute and bbox conditions into one expression.
+
+    The bbox test is on the covering columns, so it keeps precincts whose bounding box
+    intersects the query box; that is what lets row-group statistics prune the scan.
+    """
+    conditions = [parse_where(clause) if isinstance(clause, str) else clause for clause in where]
+    if states:
+        conditions.append(pc.field("state").isin(list(states)))
+    if elections:
+        conditions.append(pc.field("election").isin(list(elections)))
+    if bbox is not None:
+        minx, miny, maxx, maxy = bbox
+        conditions += [
+            pc.field("bbox", "xmin") <= maxx, pc.field("bbox", "xmax") >= minx,
+            pc.field("bbox", "ymin") <= maxy, pc.field("bbox", "ymax") >= miny,
+        ]
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def query(where=(), columns=None, bbox=None, states=None, elections=None, root=STORE_DIR):
+    """
+    Read matching precincts from the national store.
+
+    ``where`` takes ``"HSP_CVAP_PCT>0.4"``-style clauses or dataset expressions. Only the
+    requested columns are read (plus state and election); the result is a GeoDataFrame
+    when ``geometry`` is among them and a DataFrame otherwise.
+    """
+    dataset = open_store(root)
+    if columns is None:
+        columns = [name for name in dataset.schema.names if name != "bbox"]
+    else:
+        columns = list(dict.fromkeys(["state", "election"] + list(columns)))
+    table = dataset.to_table(columns=columns, filter=build_filter(where, bbox, states, elections))
+
+    frame = table.drop_columns([c for c in ["geometry"] if c in columns]).to_pandas()
+    if "geometry" not in columns:
+        return frame
+    geometry = gpd.GeoSeries.from_wkb(table.column("geometry").to_numpy(zero_copy_only=False), crs=STORE_CRS)
+    return gpd.GeoDataFrame(frame, geometry=geometry.values, crs=STORE_CRS)
+
+
+def scan_plan(where=(), bbox=None, states=None, elections=None, root=STORE_DIR):
+    """Files and row groups a query touches after partition and statistics pruning, vs the whole store."""
+    dataset = open_store(root)
+    expression = build_filter(where, bbox, states, elections)
+    total_files = total_groups = files = groups = 0
+    for fragment in dataset.get_fragments():
+        total_files += 1
+        total_groups += fragment.metadata.num_row_groups
+    for fragment in dataset.get_fragments(filter=expression):
+        kept = fragment.split_by_row_group(expression, schema=dataset.schema)
+        files += bool(kept)
+        groups += len(kept)
+    return {"files": files, "total_files": total_files, "row_groups": groups, "total_row_groups": total_groups}
+
+
+# ---------- MAIN ----------
+def main():
+    parser = argparse.ArgumentParser(description="Publish final precincts to the national GeoParquet store, or query it.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    publish = sub.add_parser("publish", help="Write states into the store")
+    publish.add_argument("states", nargs="*", help="States to publish (default: every state in Final_precincts)")
+    publish.add_argument("--election", help="Election partition (default: from the vote columns, e.g. G24)")
+    publish.add_argument("--root", default=STORE_DIR)
+
+    search = sub.add_parser("query", help="Filter precincts across states")
+    search.add_argument("--where", action="append", default=[], help='e.g. --where "HSP_CVAP_PCT>0.4" --where "HAR_MARGIN<0.05"')
+    search.add_argument("--columns", nargs="+")
+    search.add_argument("--bbox", nargs=4, type=float, metavar=("MINX", "MINY", "MAXX", "MAXY"))
+    search.add_argument("--states", nargs="+")
+    search.add_argument("--elections", nargs="+")
+    search.add_argument("--out", help="Save the result (.parquet, .csv or .geojson)")
+    search.add_argument("--root", default=STORE_DIR)
+    args = parser.parse_args()
+
+    if args.command == "publish":
+        states = args.states or sorted(
+            s for s in os.listdir(FINAL_DIR) if os.path.isdir(os.path.join(FINAL_DIR, s))
+        )
+        for state in states:
+            precinct = gpd.read_file(os.path.join(FINAL_DIR, state, f"{state}_precinct_all_pop.geojson"))
+            out_dir = publish_state(precinct, state, args.election, args.root)
+            print(f"Published {state}: {len(precinct)} precincts to {out_dir}")
+        return
+
+    plan = scan_plan(args.where, args.bbox, args.states, args.elections, args.root)
+    result = query(args.where, args.columns, args.bbox, args.states, args.elections, args.root)
+    print(f"Scanned {plan['files']}/{plan['total_files']} files, {plan['row_groups']}/{plan['total_row_groups']} row groups")
+    if args.out:
+        if args.out.endswith(".parquet"):
+            result.to_parquet(args.out, index=False)
+        elif args.out.endswith(".geojson"):
+            result.to_file(args.out, driver="GeoJSON")
+        else:
+            pd.DataFrame(result.drop(columns="geometry", errors="ignore")).to_csv(args.out, index=False)
+        print(f"=== Saved {len(result)} precincts to {args.out} ===")
+    else:
+        print(pd.DataFrame(result.drop(columns="geometry", errors="ignore")).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
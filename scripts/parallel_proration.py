@@ -0,0 +1,127 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+_executor = None
+_executor_workers = 0
+
+
+# ---------- SHARED ARRAYS ----------
+class SharedArray:
+    """A NumPy array backed by a named shared memory block that worker processes can map."""
+
+    def __init__(self, shape, dtype, order="F"):
+        self.shape, self.dtype, self.order = tuple(shape), np.dtype(dtype), order
+        size = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.array = np.ndarray(self.shape, self.dtype, buffer=self.shm.buf, order=order)
+
+    @property
+    def spec(self):
+        return self.shm.name, self.shape, self.dtype.str, self.order
+
+    def release(self):
+        del self.array
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _attach(spec):
+    name, shape, dtype, order = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, np.dtype(dtype), buffer=shm.buf, order=order)
+
+
+# ---------- WORKER ----------
+def _prorate_column(task):
+    """
+    Worker: prorate one block group column onto blocks, writing into the shared output.
+
+    Mirrors the serial loop: weights are the block's share of its block group's total for
+    the weight column (0 where that total is 0), the block estimate is block group value
+    times weight, and unassigned blocks get 0.
+    """
+    job, weight_idx, specs = task
+    handles = [_attach(spec) for spec in specs]
+    try:
+        (_, codes), (_, weights), (_, values), (_, out) = handles
+        valid = codes >= 0
+        safe = np.where(valid, codes, 0)
+        w = weights[:, weight_idx]
+
+        totals = np.bincount(safe[valid], weights=w[valid], minlength=len(values))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            share = w / np.where(valid, totals[safe], np.nan)
+        share[np.isnan(share)] = 0
+
+        prorated = np.where(valid, values[safe, job], np.nan) * share
+        prorated[np.isnan(prorated)] = 0
+        out[:, job] = np.round(prorated)
+    finally:
+        for shm, _ in handles:
+            shm.close()
+    return job
+
+
+def _pool(workers):
+    global _executor, _executor_workers
+    if _executor is None or _executor_workers != workers:
+        shutdown()
+        _executor = ProcessPoolExecutor(max_workers=workers)
+        _executor_workers = workers
+    return _executor
+
+
+def shutdown():
+    """Stop the worker pool kept alive between proration stages."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+
+
+# ---------- ENTRY ----------
+def prorate_columns(census_block, assignment, source, jobs, workers):
+    """
+    Prorate several block group columns onto blocks in parallel; returns {column: block estimates}.
+
+    ``jobs`` is a list of (block group column, block weight columns); a job with several
+    weight columns uses their sum, as for 2OM_CVAP23. The assignment codes, the distinct
+    weight vectors and the block group values are copied once into shared memory and each
+    worker maps them zero-copy, so no GeoDataFrame is ever pickled.
+    """
+    weight_keys = list(dict.fromkeys(tuple(cols) for _, cols in jobs))
+    n_blocks = len(census_block)
+
+    arrays = []
+    try:
+        codes = SharedArray((n_blocks,), "int64")
+        codes.array[:] = pd.Index(source.index).get_indexer(assignment)
+        arrays.append(codes)
+
+        weights = SharedArray((n_blocks, len(weight_keys)), "float64")
+        for i, cols in enumerate(weight_keys):
+            weights.array[:, i] = census_block[list(cols)].sum(axis=1).to_numpy(dtype="float64")
+        arrays.append(weights)
+
+        values = SharedArray((len(source), len(jobs)), "float64")
+        for j, (col, _) in enumerate(jobs):
+            values.array[:, j] = source[col].to_numpy(dtype="float64", na_value=np.nan)
+        arrays.append(values)
+
+        out = SharedArray((n_blocks, len(jobs)), "int64")
+        arrays.append(out)
+
+        specs = [a.spec for a in arrays]
+        tasks = [(j, weight_keys.index(tuple(cols)), specs) for j, (_, cols) in enumerate(jobs)]
+        list(_pool(workers).map(_prorate_column, tasks))
+
+        return {
+            col: pd.Series(out.array[:, j].copy(), index=census_block.index)
+            for j, (col, _) in enumerate(jobs)
+        }
+    finally:
+        for array in arrays:
+            array.release()
@@ -3,6 +3,8 @@ import pandas as pd
 import maup
 import re
 
+from geojson_writer import write_geojson
+
 # ========== CONFIGURABLE VARIABLES ==========
 STATE_NAME = "la"           # Example: "la" or "tx"
 CENSUS_YEAR = 20          # Census PL year
@@ -194,7 +196,7 @@ def main():
     precinct = precinct[final_cols]
 
     out_file = f"{STATE_NAME}_precinct_all_pop.geojson"
-    precinct.to_crs("EPSG:4326").to_file(out_file, driver="GeoJSON")
+    write_geojson(precinct.to_crs("EPSG:4326"), out_file)
     print(f"\n=== Saved to {out_file} ===")
 
 
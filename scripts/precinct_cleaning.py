@@ -3,6 +3,8 @@ import maup
 import pandas as pd
 import re
 
+from geojson_writer import write_geojson
+
 census_block = gpd.read_file(r"la_pl2020_b\la_pl2020_b.shp").to_crs("EPSG:5070")
 block_group = gpd.read_file(r"la_race_2023_bg\la_race_2023_bg.shp").to_crs("EPSG:5070")
 block_group_cvap = gpd.read_file(r"la_cvap_2023_bg\la\la_cvap_2023_bg.shp").to_crs("EPSG:5070")
@@ -246,4 +248,4 @@ comparison.to_csv("population_comparison.csv")
 cvap_comparison.to_csv("cvap_comparison.csv")
 
 # Save precinct file
-precinct.to_crs("EPSG:4326").to_file("precinct_all_pop.geojson", driver="GeoJSON")
\ No newline at end of file
+write_geojson(precinct.to_crs("EPSG:4326"), "precinct_all_pop.geojson")
\ No newline at end of file
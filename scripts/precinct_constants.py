@@ -0,0 +1,24 @@
+# Shared by the pipeline and the tools that read its outputs; keep this module free of heavy imports.
+import re
+
+FINAL_DIR = "Final_precincts"   # Output folder of precinct_cleaning_income.py, one subfolder per state
+
+# Prorated components of each dataset; the first race/CVAP component is Hispanic, the rest non-Hispanic
+RACE_COMPONENTS = ["HSP_POP23", "WHT_POP23", "BLK_POP23", "AIA_POP23", "ASN_POP23", "HPI_POP23", "OTH_POP23", "2OM_POP23"]
+CVAP_COMPONENTS = ["HSP_CVAP23", "WHT_CVAP23", "BLK_CVAP23", "ASN_CVAP23", "AIA_CVAP23", "HPI_CVAP23", "2OM_CVAP23"]
+INCOME_COMPONENTS = [
+    "LESS_10K23", "10K_15K23", "15K_20K23", "20K_25K23", "25K_30K23",
+    "30K_35K23", "35K_40K23", "40K_45K23", "45K_50K23", "50K_60K23",
+    "60K_75K23", "75K_100K23", "100_125K23", "125_150K23",
+    "150_200K23", "200K_MOR23"
+]
+
+# Count columns of the final precinct layer: components plus their derived totals
+VOTE_COLUMNS = ["G24PREDHAR", "G24PRERTRU"]
+RACE_COLUMNS = RACE_COMPONENTS + ["NHSP_POP23", "TOT_POP23"]
+CVAP_COLUMNS = CVAP_COMPONENTS + ["NHSP_CVAP23", "TOT_CVAP23"]
+INCOME_COLUMNS = INCOME_COMPONENTS + ["TOT_HOUS23"]
+HIGH_INCOME_COLUMNS = ["100_125K23", "125_150K23", "150_200K23", "200K_MOR23"]
+
+ELECTION_PATTERN = re.compile(r"^([GPR]\d{2})[A-Z]{3}")                 # Vote columns, e.g. G24PREDHAR -> G24
+FILTER_PATTERN = re.compile(r"^(\w+)\s*(>=|<=|!=|=|>|<)\s*(.+)$")       # "COLUMN op value" query clauses
@@ -0,0 +1,208 @@
+import argparse
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from precinct_constants import FINAL_DIR
+
+# ========== CONFIGURABLE VARIABLES ==========
+INDEX_CRS = "EPSG:4326"         # Lookups take lon/lat, same as the final GeoJSON files
+ID_COLUMN = "UNIQUE_ID"
+GRID_SIZE = 1024                # Grid cells along the longer side of the state bbox
+BATCH_SIZE = 1_000_000          # Points per vectorized lookup batch
+# ============================================
+
+# Grid cell codes; codes >= 0 are precinct row positions
+EMPTY_CELL = -2   # Cell touches no precinct, points in it have no match
+EDGE_CELL = -1    # Cell crosses a precinct boundary, points need an exact test
+
+
+def precinct_path(state):
+    return os.path.join(FINAL_DIR, state, f"{state}_precinct_all_pop.geojson")
+
+
+def index_prefix(state):
+    return os.path.join(FINAL_DIR, state, f"{state}_precinct_index")
+
+
+# ---------- INDEX ----------
+class PrecinctIndex:
+    """
+    Point-in-precinct index over one state's final precinct layer.
+
+    A regular grid covers the state bbox. Cells lying entirely inside one precinct
+    store that precinct directly, so most points resolve with array indexing alone.
+    Only points falling in cells that cross a boundary are tested exactly against
+    the precinct polygons through an STRtree.
+    """
+
+    def __init__(self, precinct, grid, origin, cell_size):
+        self.precinct = precinct.reset_index(drop=True)
+        self.attributes = pd.DataFrame(self.precinct.drop(columns="geometry")).convert_dtypes()
+        self.tree = shapely.STRtree(self.precinct.geometry.values)
+        self.grid = grid
+        self.origin = origin
+        self.cell_size = cell_size
+
+    @classmethod
+    def build(cls, precinct, grid_size=GRID_SIZE):
+        precinct = precinct.to_crs(INDEX_CRS).reset_index(drop=True)
+        minx, miny, maxx, maxy = precinct.total_bounds
+        cell_size = max(maxx - minx, maxy - miny) / grid_size
+        nx = int(np.ceil((maxx - minx) / cell_size)) or 1
+        ny = int(np.ceil((maxy - miny) / cell_size)) or 1
+
+        tree = shapely.STRtree(precinct.geometry.values)
+        grid = np.full(ny * nx, EMPTY_CELL, dtype=np.int32)
+
+        # Classify one grid row band at a time to keep the cell boxes small in memory
+        cols = np.arange(nx)
+        rows_per_band = max(1, 250_000 // nx)
+        for start in range(0, ny, rows_per_band):
+            rows = np.arange(start, min(start + rows_per_band, ny))
+            iy, ix = (a.ravel() for a in np.meshgrid(rows, cols, indexing="ij"))
+            cells = shapely.box(
+                minx + ix * cell_size, miny + iy * cell_size,
+                minx + (ix + 1) * cell_size, miny + (iy + 1) * cell_size,
+            )
+            flat = iy * nx + ix
+
+            touched, _ = tree.query(cells, predicate="intersects")
+            grid[flat[touched]] = EDGE_CELL
+
+            inside, owner = tree.query(cells, predicate="within")
+            grid[flat[inside]] = owner
+
+        return cls(precinct, grid.reshape(ny, nx), (minx, miny), cell_size)
+
+    # ---------- PERSISTENCE ----------
+    def save(self, prefix):
+        np.savez_compressed(
+            f"{prefix}.npz", grid=self.grid,
+            origin=np.asarray(self.origin), cell_size=np.asarray(self.cell_size),
+        )
+        self.precinct.to_parquet(f"{prefix}.parquet")
+
+    @classmethod
+    def load(cls, prefix):
+        with np.load(f"{prefix}.npz") as data:
+            grid = data["grid"]
+            origin = tuple(data["origin"])
+            cell_size = float(data["cell_size"])
+        precinct = gpd.read_parquet(f"{prefix}.parquet")
+        return cls(precinct, grid, origin, cell_size)
+
+    # ---------- LOOKUP ----------
+    def locate(self, lon, lat):
+        """Return the precinct row position for every point, -1 where no precinct contains it."""
+        lon = np.asarray(lon, dtype="float64")
+        lat = np.asarray(lat, dtype="float64")
+        ny, nx = self.grid.shape
+
+        with np.errstate(invalid="ignore"):
+            fx = np.floor((lon - self.origin[0]) / self.cell_size)
+            fy = np.floor((lat - self.origin[1]) / self.cell_size)
+        on_grid = np.isfinite(fx) & np.isfinite(fy) & (fx >= 0) & (fx < nx) & (fy >= 0) & (fy < ny)
+
+        codes = np.full(len(lon), EMPTY_CELL, dtype=np.int32)
+        codes[on_grid] = self.grid[fy[on_grid].astype(np.int64), fx[on_grid].astype(np.int64)]
+
+        result = np.where(codes >= 0, codes, -1)
+
+        # Exact test only for points near a boundary; points on a shared edge take the first match
+        edge = np.flatnonzero(codes == EDGE_CELL)
+        if len(edge):
+            point_idx, precinct_idx = self.tree.query(
+                shapely.points(lon[edge], lat[edge]), predicate="intersects"
+            )
+            matched, first = np.unique(point_idx, return_index=True)
+            result[edge[matched]] = precinct_idx[first]
+
+        return result
+
+    def lookup(self, lon, lat, columns=None):
+        """Return UNIQUE_ID plus the requested attribute columns for every point."""
+        columns = [ID_COLUMN] + [c for c in (columns or []) if c != ID_COLUMN]
+        positions = self.locate(lon, lat)
+        missing = positions < 0
+
+        if len(self.attributes) == 0:
+            return pd.DataFrame(pd.NA, index=range(len(positions)), columns=columns)
+
+        result = self.attributes[columns].take(np.where(missing, 0, positions)).reset_index(drop=True)
+        result.loc[missing, :] = pd.NA
+        return result
+
+    def lookup_batches(self, lon, lat, columns=None, batch_size=BATCH_SIZE):
+        """Yield lookup results for consecutive slices of the input arrays."""
+        for start in range(0, len(lon), batch_size):
+            stop = start + batch_size
+            yield self.lookup(lon[start:stop], lat[start:stop], columns)
+
+
+def index_is_current(state):
+    """True when both index files exist and are newer than the final precinct file."""
+    prefix = index_prefix(state)
+    files = [f"{prefix}.npz", f"{prefix}.parquet"]
+    if not all(os.path.exists(f) for f in files):
+        return False
+    source = precinct_path(state)
+    if not os.path.exists(source):
+        return True
+    return min(os.path.getmtime(f) for f in files) >= os.path.getmtime(source)
+
+
+def load_index(state):
+    """Load a state's persisted index, rebuilding it when the final precinct file is missing from it or newer."""
+    prefix = index_prefix(state)
+    if index_is_current(state):
+        return PrecinctIndex.load(prefix)
+    index = PrecinctIndex.build(gpd.read_file(precinct_path(state)))
+    index.save(prefix)
+    return index
+
+
+# ---------- MAIN ----------
+def main():
+    parser = argparse.ArgumentParser(description="Build precinct lookup indexes and geocode lon/lat points in bulk.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Build and persist the index for one or more states")
+    build.add_argument("states", nargs="+")
+    build.add_argument("--grid-size", type=int, default=GRID_SIZE)
+
+    lookup = sub.add_parser("lookup", help="Assign every row of a CSV of points to a precinct")
+    lookup.add_argument("state")
+    lookup.add_argument("points_csv")
+    lookup.add_argument("out_csv")
+    lookup.add_argument("--lon", default="lon", help="Longitude column name")
+    lookup.add_argument("--lat", default="lat", help="Latitude column name")
+    lookup.add_argument("--columns", nargs="*", default=[], help="Precinct attributes to attach")
+    lookup.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        for state in args.states:
+            index = PrecinctIndex.build(gpd.read_file(precinct_path(state)), args.grid_size)
+            index.save(index_prefix(state))
+            edge_share = (index.grid == EDGE_CELL).mean()
+            print(f"=== {state}: {index.grid.shape[1]}x{index.grid.shape[0]} grid, "
+                  f"{edge_share:.1%} boundary cells, saved to {index_prefix(state)} ===")
+        return
+
+    index = load_index(args.state)
+    header = True
+    for chunk in pd.read_csv(args.points_csv, chunksize=args.batch_size):
+        found = index.lookup(chunk[args.lon].to_numpy(), chunk[args.lat].to_numpy(), args.columns)
+        found.index = chunk.index
+        pd.concat([chunk, found], axis=1).to_csv(args.out_csv, mode="w" if header else "a", header=header, index=False)
+        header = False
+    print(f"\n=== Saved to {args.out_csv} ===")
+
+
+if __name__ == "__main__":
+    main()
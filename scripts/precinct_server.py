@@ -0,0 +1,343 @@
+import argparse
+import asyncio
+import gzip
+import hashlib
+import math
+import os
+import threading
+import traceback
+from collections import OrderedDict
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from precinct_constants import FILTER_PATTERN, FINAL_DIR
+from precinct_lookup import ID_COLUMN, PrecinctIndex, load_index
+
+try:
+    import orjson
+
+    def dumps(obj):
+        return orjson.dumps(obj)
+except ImportError:
+    import json
+
+    def dumps(obj):
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+# ========== CONFIGURABLE VARIABLES ==========
+HOST = "127.0.0.1"
+PORT = 8765
+SIMPLIFIED_DIR = "simplified_maps"
+CACHE_SIZE = 512          # Responses kept in the in-memory LRU cache
+GZIP_MIN_BYTES = 1024     # Smaller bodies are not worth compressing
+MAX_FEATURES = 20000      # Upper bound on features returned by one query
+MAX_ZOOM = 24             # Deepest tile zoom accepted
+# ============================================
+
+FILTER_OPS = {
+    ">=": np.greater_equal, "<=": np.less_equal, "!=": np.not_equal,
+    "=": np.equal, ">": np.greater, "<": np.less,
+}
+
+
+class QueryError(Exception):
+    pass
+
+
+# ---------- LAYERS ----------
+def discover_states():
+    return sorted(
+        state for state in os.listdir(FINAL_DIR)
+        if os.path.isdir(os.path.join(FINAL_DIR, state))
+    )
+
+
+def load_layers(states, layer):
+    """Load every state's precinct layer and lookup index once at startup."""
+    layers = {}
+    for state in states:
+        try:
+            if layer == "simplified":
+                path = os.path.join(SIMPLIFIED_DIR, f"{state}_precinct_2024.json")
+                layers[state] = PrecinctIndex.build(gpd.read_file(path))
+            else:
+                layers[state] = load_index(state)
+        except Exception as exc:  # A missing or unreadable state should not stop the others
+            print(f"Skipping {state}: {exc}")
+            continue
+        print(f"Loaded {state}: {len(layers[state].precinct)} precincts")
+    return layers
+
+
+def tile_bounds(z, x, y):
+    """Lon/lat bounds of a web mercator XYZ tile."""
+    n = 2 ** z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360 - 180, lat(y + 1), (x + 1) / n * 360 - 180, lat(y)
+
+
+# ---------- QUERIES ----------
+class PrecinctQueries:
+    def __init__(self, layers):
+        self.layers = layers
+
+    def layer(self, state):
+        if state not in self.layers:
+            raise QueryError(f"Unknown state: {state}")
+        return self.layers[state]
+
+    def columns(self, index, params):
+        requested = [c for c in params.get("columns", [""])[0].split(",") if c]
+        unknown = [c for c in requested if c not in index.attributes.columns]
+        if unknown:
+            raise QueryError(f"Unknown columns: {', '.join(unknown)}")
+        return [ID_COLUMN] + [c for c in requested if c != ID_COLUMN]
+
+    def features(self, index, positions, params):
+        if len(positions) > MAX_FEATURES:
+            raise QueryError(f"Query matches {len(positions)} precincts, limit is {MAX_FEATURES}")
+        columns = self.columns(index, params)
+        records = index.attributes[columns].take(positions).astype(object)
+        records = records.where(records.notna(), None).to_dict(orient="records")
+
+        if params.get("geometry", ["1"])[0] == "0":
+            return {"count": len(records), "records": records}
+
+        # Geometry is already JSON text, so splice it in rather than round-tripping through dicts
+        geometries = shapely.to_geojson(index.precinct.geometry.values[positions])
+        features = b",".join(
+            b'{"type":"Feature","properties":' + dumps(props) + b',"geometry":' + geom.encode() + b"}"
+            for props, geom in zip(records, geometries)
+        )
+        return b'{"type":"FeatureCollection","features":[' + features + b"]}"
+
+    def states(self):
+        return {
+            state: {
+                "precincts": len(index.precinct),
+                "bbox": [float(v) for v in index.precinct.total_bounds],
+                "columns": list(index.attributes.columns),
+            }
+            for state, index in self.layers.items()
+        }
+
+    def bbox(self, state, params, bounds=None):
+        index = self.layer(state)
+        if bounds is None:
+            try:
+                bounds = [float(v) for v in params["bbox"][0].split(",")]
+            except (KeyError, ValueError):
+                raise QueryError("bbox must be minx,miny,maxx,maxy")
+            if len(bounds) != 4:
+                raise QueryError("bbox must be minx,miny,maxx,maxy")
+        positions = np.sort(index.tree.query(shapely.box(*bounds), predicate="intersects"))
+        return self.features(index, positions, params)
+
+    def tile(self, state, z, x, y, params):
+        return self.bbox(state, params, tile_bounds(z, x, y))
+
+    def precinct(self, state, precinct_id, params):
+        index = self.layer(state)
+        positions = np.flatnonzero((index.attributes[ID_COLUMN] == precinct_id).fillna(False).to_numpy())
+        if not len(positions):
+            raise QueryError(f"Unknown precinct: {precinct_id}")
+        return self.features(index, positions, params)
+
+    def filter(self, state, params):
+        index = self.layer(state)
+        mask = np.ones(len(index.attributes), dtype=bool)
+        for clause in params.get("where", []):
+            match = FILTER_PATTERN.match(clause)
+            if not match or match.group(1) not in index.attributes.columns:
+                raise QueryError(f"Bad filter: {clause}")
+            column, op, value = match.groups()
+            values = index.attributes[column]
+            if pd.api.types.is_numeric_dtype(values):
+                try:
+                    value = float(value)
+                except ValueError:
+                    raise QueryError(f"Bad filter: {clause}")
+            result = FILTER_OPS[op](values, value)
+            mask &= pd.Series(result).fillna(False).to_numpy(dtype=bool)
+        return self.features(index, np.flatnonzero(mask), params)
+
+    def point(self, state, params):
+        index = self.layer(state)
+        try:
+            lon, lat = float(params["lon"][0]), float(params["lat"][0])
+        except (KeyError, ValueError):
+            raise QueryError("lon and lat are required")
+        positions = index.locate([lon], [lat])
+        return self.features(index, positions[positions >= 0], params)
+
+    def route(self, path, params):
+        parts = [unquote(p) for p in path.strip("/").split("/") if p]
+        if parts == ["states"]:
+            return self.states()
+        if len(parts) == 2 and parts[1] == "bbox":
+            return self.bbox(parts[0], params)
+        if len(parts) == 2 and parts[1] == "filter":
+            return self.filter(parts[0], params)
+        if len(parts) == 2 and parts[1] == "point":
+            return self.point(parts[0], params)
+        if len(parts) == 3 and parts[1] == "precinct":
+            return self.precinct(parts[0], parts[2], params)
+        if len(parts) == 5 and parts[1] == "tile":
+            try:
+                z, x, y = (int(p) for p in parts[2:])
+            except ValueError:
+                raise QueryError("tile path must be /<state>/tile/<z>/<x>/<y>")
+            if not (0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+                raise QueryError(f"tile {z}/{x}/{y} is out of range")
+            return self.tile(parts[0], z, x, y, params)
+        raise LookupError(path)
+
+
+def encode(result):
+    return result if isinstance(result, bytes) else dumps(result)
+
+
+# ---------- HTTP ----------
+class ResponseCache:
+    """
+    Small LRU of encoded response bodies keyed by normalized request URL.
+
+    Requests are answered on worker threads, so every access holds the lock.
+    """
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+class PrecinctServer:
+    def __init__(self, queries, cache_size=CACHE_SIZE):
+        self.queries = queries
+        self.cache = ResponseCache(cache_size)
+
+    def respond(self, target):
+        url = urlsplit(target)
+        params = parse_qs(url.query)
+        key = url.path + "?" + "&".join(f"{k}={v}" for k in sorted(params) for v in params[k])
+
+        entry = self.cache.get(key)
+        if entry is None:
+            try:
+                body = encode(self.queries.route(url.path, params))
+                status = 200
+            except QueryError as exc:
+                return 400, dumps({"error": str(exc)}), None, None
+            except LookupError:
+                return 404, dumps({"error": "Not found"}), None, None
+            etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+            gzipped = gzip.compress(body, 6) if len(body) >= GZIP_MIN_BYTES else None
+            entry = (status, body, etag, gzipped)
+            self.cache.put(key, entry)
+        return entry
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+                if method not in ("GET", "HEAD"):
+                    status, body, etag, gzipped = 405, dumps({"error": "Method not allowed"}), None, None
+                else:
+                    try:
+                        status, body, etag, gzipped = await asyncio.to_thread(self.respond, target)
+                    except Exception:  # Any failure in a query still gets an answer
+                        traceback.print_exc()
+                        status, body, etag, gzipped = 500, dumps({"error": "Internal server error"}), None, None
+
+                response_headers = {
+                    "Content-Type": "application/json",
+                    "Access-Control-Allow-Origin": "*",
+                    "Connection": "keep-alive" if keep_alive else "close",
+                }
+                if etag:
+                    response_headers["ETag"] = etag
+                    response_headers["Cache-Control"] = "no-cache"
+                    if etag in [t.strip() for t in headers.get("if-none-match", "").split(",")]:
+                        status, body = 304, b""
+                if status == 200 and gzipped is not None and "gzip" in headers.get("accept-encoding", ""):
+                    body = gzipped
+                    response_headers["Content-Encoding"] = "gzip"
+                    response_headers["Vary"] = "Accept-Encoding"
+                response_headers["Content-Length"] = str(len(body))
+
+                reason = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}[status]
+                head = f"HTTP/1.1 {status} {reason}\r\n" + "".join(f"{k}: {v}\r\n" for k, v in response_headers.items()) + "\r\n"
+                writer.write(head.encode("latin-1"))
+                if method != "HEAD":
+                    writer.write(body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(layers, host, port, cache_size):
+    server = PrecinctServer(PrecinctQueries(layers), cache_size)
+    listener = await asyncio.start_server(server.handle, host, port)
+    print(f"\n=== Serving {len(layers)} states on http://{host}:{port} ===")
+    async with listener:
+        await listener.serve_forever()
+
+
+# ---------- MAIN ----------
+def main():
+    parser = argparse.ArgumentParser(description="Serve precinct attributes and geometry to the frontend from memory.")
+    parser.add_argument("states", nargs="*", help="States to load (default: every folder in Final_precincts)")
+    parser.add_argument("--layer", choices=["final", "simplified"], default="final",
+                        help="Serve the full final precincts or the simplified_maps geometry")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE)
+    args = parser.parse_args()
+
+    layers = load_layers(args.states or discover_states(), args.layer)
+    asyncio.run(serve(layers, args.host, args.port, args.cache_size))
+
+
+if __name__ == "__main__":
+    main()
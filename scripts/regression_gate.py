@@ -0,0 +1,421 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+import precinct_cleaning_income as pipeline
+from precinct_constants import INCOME_COMPONENTS
+
+# ========== CONFIGURABLE VARIABLES ==========
+REGRESSION_DIR = "regression"        # Golden outputs and recorded baselines
+FIXTURE_STATE = "fx"
+FIXTURE_SEED = 42
+FIXTURE_SCALE = 3                    # Fixture side length in 60-block tiles; large enough that timed work dominates noise
+FIXTURE_CRS = "EPSG:5070"
+TIME_MARGIN = 1.0                    # Allowed growth of a stage's CPU time over the baseline, as a fraction
+TIME_FLOOR_S = 1.0                   # CPU timings below this are too noisy to gate
+MEMORY_MARGIN = 0.25                 # Allowed growth of a stage's peak traced (Python heap) memory
+MEMORY_FLOOR_MB = 1.0                # Traced peaks below this are too noisy to gate
+RSS_MARGIN = 0.25                    # Allowed growth of a stage's peak resident memory, workers included
+RSS_INTERVAL_S = 0.02                # Resident memory sampling period
+REPEAT = 3                           # Untraced runs per case; stage timings keep the fastest run
+# ============================================
+
+# Pipeline configurations gated; cases sharing a golden must produce identical output
+CASES = {
+    "assign": ({}, "assign"),
+    "parallel": ({"PRORATION_WORKERS": 2}, "assign"),
+    # Small chunks so the fixture's straddling blocks take the multi-process overlay path
+    "areal": ({"ALLOCATION_MODE": "areal", "AREAL_WORKERS": 2, "AREAL_CHUNK_BLOCKS": 100}, "areal"),
+}
+STAGES = [
+    "load_data", "allocate_blocks", "prorate_race_data", "prorate_cvap_data",
+    "prorate_income_data", "conservation_diagnostics", "write_geojson", "write_summaries",
+]
+RACE_BG_COLUMNS = ["HSP_POP23", "WHT_NHSP23", "BLK_NHSP23", "AIA_NHSP23", "ASN_NHSP23", "HPI_NHSP23", "OTH_NHSP23", "2OM_NHSP23"]
+CVAP_BG_COLUMNS = ["CVAP_HSP23", "CVAP_WHT23", "CVAP_BLA23", "CVAP_ASI23", "CVAP_AMI23", "CVAP_NHP23", "CVAP_2OM23", "CVAP_AIW23", "CVAP_ASW23", "CVAP_BLW23", "CVAP_AIB23"]
+
+
+# ---------- SYNTHETIC FIXTURE ----------
+def grid(nx, ny, size, x0=1_500_000.0, y0=1_500_000.0):
+    xs, ys = np.meshgrid(np.arange(nx), np.arange(ny))
+    xs, ys = xs.ravel(), ys.ravel()
+    return shapely.box(x0 + xs * size, y0 + ys * size, x0 + (xs + 1) * size, y0 + (ys + 1) * size)
+
+
+def write_fixture(out_dir, seed=FIXTURE_SEED, scale=FIXTURE_SCALE):
+    """
+    Write a deterministic state of (60s)x(60s) blocks, (6s)x(6s) block groups and (7s)x(7s) precincts for scale s.
+
+    Precinct edges do not follow block edges, so areal mode has straddling blocks, and
+    sparse categories (HPI, CVAP NHP) leave some block groups with zero block weight.
+    Returns the input paths in the shape ``run_pipeline`` expects.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    side = 60 * scale
+    blocks = gpd.GeoDataFrame({"GEOID20": [f"330010001{i:06d}" for i in range(side * side)]}, geometry=grid(side, side, 10), crs=FIXTURE_CRS)
+    pop = ["P0020002", "P0020005", "P0020006", "P0020007", "P0020008", "P0020009", "P0020010", "P0020011"]
+    for col in pop:
+        blocks[col] = rng.poisson(0.05 if col == "P0020009" else 3, len(blocks))
+    blocks["P0020003"] = blocks[pop[1:]].sum(axis=1)
+    blocks["P0020001"] = blocks["P0020002"] + blocks["P0020003"]
+    vap = [col.replace("P002", "P004") for col in pop]
+    for source, target in zip(pop, vap):
+        blocks[target] = rng.binomial(blocks[source], 0.75)
+    blocks["P0040003"] = blocks[vap[1:]].sum(axis=1)
+    blocks["P0040001"] = blocks["P0040002"] + blocks["P0040003"]
+
+    bg_geoms = grid(6 * scale, 6 * scale, 100)
+    geoids = [f"3300100{i:06d}" for i in range(len(bg_geoms))]
+    race = gpd.GeoDataFrame({"GEOID": geoids}, geometry=bg_geoms, crs=FIXTURE_CRS)
+    for col in RACE_BG_COLUMNS:
+        race[col] = rng.poisson(2 if col == "HPI_NHSP23" else 300, len(race))
+    race["NHSP_POP23"] = race[RACE_BG_COLUMNS[1:]].sum(axis=1)
+    race["TOT_POP23"] = race["HSP_POP23"] + race["NHSP_POP23"]
+
+    cvap = gpd.GeoDataFrame({"GEOID": geoids}, geometry=bg_geoms, crs=FIXTURE_CRS)
+    for col in CVAP_BG_COLUMNS:
+        cvap[col] = rng.poisson(1 if col == "CVAP_NHP23" else 150, len(cvap))
+    cvap["CVAP_TOT23"] = cvap[CVAP_BG_COLUMNS].sum(axis=1)
+
+    income = gpd.GeoDataFrame({"GEOID": geoids}, geometry=bg_geoms, crs=FIXTURE_CRS)
+    for col in INCOME_COMPONENTS:
+        income[col] = rng.poisson(40, len(income))
+
+    precinct_geoms = grid(7 * scale, 7 * scale, 600 / 7)
+    n = len(precinct_geoms)
+    precinct = gpd.GeoDataFrame({
+        "UNIQUE_ID": [f"P{i:03d}" for i in range(n)],
+        "GEOID20": [f"33{1 + i % 3:03d}{i:06d}" for i in range(n)],
+        "G24PREDHAR": rng.integers(100, 900, n),
+        "G24PRERTRU": rng.integers(100, 900, n),
+        "G24PRELOTH": rng.integers(0, 20, n),
+    }, geometry=precinct_geoms, crs=FIXTURE_CRS)
+
+    paths = {}
+    for key, frame, name in [
+        ("census_block", blocks, "blocks"), ("block_group", race, "race_bg"),
+        ("block_group_cvap", cvap, "cvap_bg"), ("precinct", precinct, "precincts"), ("income_bg", income, "income_bg"),
+    ]:
+        paths[key] = os.path.join(out_dir, f"{name}.shp")
+        frame.to_file(paths[key])
+    return paths
+
+
+# ---------- RESOURCES ----------
+def child_pids():
+    """Live child processes (pool workers) from /proc; None on systems without it."""
+    try:
+        pids = []
+        for task in os.listdir("/proc/self/task"):
+            with open(f"/proc/self/task/{task}/children") as f:
+                pids += [int(pid) for pid in f.read().split()]
+        return pids
+    except (ValueError, OSError):
+        return None
+
+
+def cpu_seconds():
+    """
+    CPU time of this process, its exited children and its live pool workers.
+
+    Unlike wall time this does not grow when other processes share the CPU. A worker
+    that exits moves from the live count to the exited one, so differences stay correct.
+    """
+    t = os.times()
+    total = t.user + t.system + t.children_user + t.children_system
+    ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+    for pid in child_pids() or []:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            total += (int(fields[11]) + int(fields[12])) / ticks
+        except (OSError, IndexError, ValueError):  # Worker exited between listing and reading
+            pass
+    return total
+
+
+def process_rss():
+    """
+    Resident memory of this process plus its live child processes, in bytes.
+
+    Covers native GEOS/GDAL allocations and pool workers, which tracemalloc cannot see.
+    Read from /proc, so it is None on systems without it (then RSS is not gated).
+    """
+    children = child_pids()
+    if children is None or not hasattr(os, "sysconf"):
+        return None
+    page = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    for pid in [os.getpid()] + children:
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1]) * page
+        except OSError:  # Worker exited between listing and reading
+            pass
+    return total
+
+
+class RssSampler:
+    """Track the peak of ``process_rss`` on a background thread while a stage runs."""
+
+    def __init__(self, interval=RSS_INTERVAL_S):
+        self.interval = interval
+        self.peak = process_rss()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.done.wait(self.interval):
+            rss = process_rss()
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.done.set()
+        self.thread.join()
+        rss = process_rss()
+        if rss is not None:
+            self.peak = max(self.peak or 0, rss)
+
+
+# ---------- INSTRUMENTED RUN ----------
+def merge_stage(profile, name, seconds, cpu, peak, rss):
+    """Accumulate a stage's times and keep its largest peaks (a stage may run more than once)."""
+    entry = profile.setdefault(name, {"seconds": 0.0, "cpu_seconds": 0.0, "peak_bytes": 0, "rss_bytes": None})
+    entry["seconds"] += seconds
+    entry["cpu_seconds"] += cpu
+    entry["peak_bytes"] = max(entry["peak_bytes"], peak)
+    if rss is not None:
+        entry["rss_bytes"] = max(entry["rss_bytes"] or 0, rss)
+
+
+def instrument(name, func, profile):
+    """Wrap a pipeline stage to record its wall and CPU time, peak traced memory and peak resident memory."""
+    def timed(*args, **kwargs):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        start_mem = tracemalloc.get_traced_memory()[0]
+        start, start_cpu = time.perf_counter(), cpu_seconds()
+        sampler = RssSampler()
+        try:
+            with sampler:
+                return func(*args, **kwargs)
+        finally:
+            elapsed, cpu = time.perf_counter() - start, cpu_seconds() - start_cpu
+            peak = tracemalloc.get_traced_memory()[1] - start_mem if tracing else 0
+            merge_stage(profile, name, elapsed, cpu, peak, sampler.peak)
+    return timed
+
+
+def run_case(case, paths, output_dir, trace=False):
+    """
+    Run the pipeline once with a case's settings; returns (output frame, comparisons, stage profile).
+
+    tracemalloc slows allocation-heavy stages unevenly, so traced runs are only used for
+    Python heap peaks and untraced runs for timings and resident memory.
+    """
+    overrides, _ = CASES[case]
+    saved = {name: getattr(pipeline, name) for name in list(overrides) + STAGES + ["RUN_ID"]}
+    profile = {}
+    try:
+        for name, value in overrides.items():
+            setattr(pipeline, name, value)
+        pipeline.RUN_ID = "regression"
+        for name in STAGES:
+            setattr(pipeline, name, instrument(name, saved[name], profile))
+
+        if trace:
+            tracemalloc.start()
+        start, start_cpu = time.perf_counter(), cpu_seconds()
+        with RssSampler() as sampler:
+            pipeline.run_pipeline(FIXTURE_STATE, paths, output_dir)
+        merge_stage(profile, "total", time.perf_counter() - start, cpu_seconds() - start_cpu, tracemalloc.get_traced_memory()[1], sampler.peak)
+    finally:
+        tracemalloc.stop()
+        for name, value in saved.items():
+            setattr(pipeline, name, value)
+
+    state_dir = os.path.join(output_dir, FIXTURE_STATE)
+    output = gpd.read_file(os.path.join(state_dir, f"{FIXTURE_STATE}_precinct_all_pop.geojson"))
+    comparisons = {
+        dataset: pd.read_csv(os.path.join(state_dir, f"{FIXTURE_STATE}_{dataset}_comparison.csv"))
+        for dataset in pipeline.DERIVED_TOTALS
+    }
+    return output, comparisons, profile
+
+
+def best_profile(traced, profiles):
+    """Traced heap peaks from the traced run; fastest times and largest resident peak over the untraced runs."""
+    best = {}
+    for stage in traced:
+        rss = [p[stage]["rss_bytes"] for p in profiles if p[stage]["rss_bytes"] is not None]
+        best[stage] = {
+            "seconds": round(min(p[stage]["seconds"] for p in profiles), 4),
+            "cpu_seconds": round(min(p[stage]["cpu_seconds"] for p in profiles), 4),
+            "peak_bytes": int(traced[stage]["peak_bytes"]),
+            "rss_bytes": int(max(rss)) if rss else None,
+        }
+    return best
+
+
+# ---------- GOLDEN OUTPUTS ----------
+def golden_frame(output):
+    """Output columns sorted by name with geometry as WKT, ordered by precinct ID."""
+    frame = pd.DataFrame(output.drop(columns="geometry"))
+    frame["geometry"] = shapely.to_wkt(output.geometry.values, rounding_precision=pipeline.COORD_PRECISION)
+    frame = frame[sorted(frame.columns)]
+    return frame.sort_values("UNIQUE_ID").reset_index(drop=True)
+
+
+def save_golden(golden_dir, output, comparisons):
+    os.makedirs(golden_dir, exist_ok=True)
+    golden_frame(output).to_parquet(os.path.join(golden_dir, "precincts.parquet"), index=False)
+    for dataset, table in comparisons.items():
+        table.to_csv(os.path.join(golden_dir, f"{dataset}_comparison.csv"), index=False)
+
+
+def diff_golden(golden_dir, output, comparisons):
+    """Differences between this run and the golden outputs, as readable lines."""
+    problems = []
+    expected = pd.read_parquet(os.path.join(golden_dir, "precincts.parquet"))
+    actual = golden_frame(output)
+
+    missing = sorted(set(expected.columns) - set(actual.columns))
+    extra = sorted(set(actual.columns) - set(expected.columns))
+    if missing or extra:
+        problems.append(f"columns differ: missing {missing}, unexpected {extra}")
+    if len(expected) != len(actual):
+        problems.append(f"{len(actual)} precincts, expected {len(expected)}")
+        return problems
+
+    for col in sorted(set(expected.columns) & set(actual.columns)):
+        if col == "geometry":
+            tolerance = 10 ** -pipeline.COORD_PRECISION
+            same = shapely.equals_exact(shapely.from_wkt(expected[col]), shapely.from_wkt(actual[col]), tolerance)
+        else:
+            same = (expected[col].astype(str) == actual[col].astype(str)).to_numpy()
+        if not same.all():
+            first = int(np.flatnonzero(~same)[0])
+            problems.append(
+                f"{col}: {int((~same).sum())} precincts differ "
+                f"(e.g. {expected['UNIQUE_ID'][first]}: {expected[col][first]} -> {actual[col][first]})"
+            )
+
+    for dataset, table in comparisons.items():
+        expected_table = pd.read_csv(os.path.join(golden_dir, f"{dataset}_comparison.csv"))
+        try:
+            pd.testing.assert_frame_equal(expected_table, table, check_exact=True)
+        except AssertionError as exc:
+            problems.append(f"{dataset}_comparison.csv: {str(exc).splitlines()[0]}")
+    return problems
+
+
+# ---------- BASELINES ----------
+def check_baseline(baseline, profile, time_margin=TIME_MARGIN, memory_margin=MEMORY_MARGIN, rss_margin=RSS_MARGIN):
+    """Stages slower or hungrier than the recorded baseline allows."""
+    problems = []
+    for stage, entry in profile.items():
+        base = baseline.get(stage)
+        if base is None:
+            continue
+        cpu, base_cpu = entry["cpu_seconds"], base.get("cpu_seconds")
+        if base_cpu is not None and max(cpu, base_cpu) >= TIME_FLOOR_S and cpu > base_cpu * (1 + time_margin):
+            problems.append(f"{stage}: {cpu:.2f} CPU s vs baseline {base_cpu:.2f} CPU s")
+        peak, base_peak = entry["peak_bytes"], base["peak_bytes"]
+        if max(peak, base_peak) >= MEMORY_FLOOR_MB * 2**20 and peak > base_peak * (1 + memory_margin):
+            problems.append(f"{stage}: traced peak {peak / 2**20:.1f} MiB vs baseline {base_peak / 2**20:.1f} MiB")
+        rss, base_rss = entry["rss_bytes"], base.get("rss_bytes")
+        if rss is not None and base_rss and rss > base_rss * (1 + rss_margin):
+            problems.append(f"{stage}: resident peak {rss / 2**20:.0f} MiB vs baseline {base_rss / 2**20:.0f} MiB")
+    return problems
+
+
+def format_stage(entry):
+    rss = f"{entry['rss_bytes'] / 2**20:.0f}" if entry.get("rss_bytes") is not None else "-"
+    cpu = f"{entry['cpu_seconds']:.2f}" if entry.get("cpu_seconds") is not None else "-"
+    return f"{entry['seconds']:>7.2f}s {cpu:>6} CPU s {entry['peak_bytes'] / 2**20:>7.1f} MiB traced {rss:>6} MiB resident"
+
+
+def print_profile(case, profile, baseline):
+    print(f"\n=== {case}: stage profile ===")
+    for stage, entry in profile.items():
+        base = baseline.get(stage)
+        reference = f"  (baseline {format_stage(base).strip()})" if base else ""
+        print(f"{stage:<26}{format_stage(entry)}{reference}")
+
+
+# ---------- MAIN ----------
+def main():
+    parser = argparse.ArgumentParser(description="Check precinct_cleaning_income.py against golden outputs and performance baselines.")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--regression-dir", default=REGRESSION_DIR)
+    parser.add_argument("--update", action="store_true", help="Rewrite goldens and baselines from this run")
+    parser.add_argument("--time-margin", type=float, default=TIME_MARGIN)
+    parser.add_argument("--memory-margin", type=float, default=MEMORY_MARGIN)
+    parser.add_argument("--rss-margin", type=float, default=RSS_MARGIN)
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--keep", help="Write the fixture and outputs here instead of a temporary directory")
+    args = parser.parse_args()
+
+    baselines_path = os.path.join(args.regression_dir, "baselines.json")
+    baselines = {}
+    if os.path.exists(baselines_path):
+        with open(baselines_path) as f:
+            baselines = json.load(f)
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = args.keep or tmp
+        paths = write_fixture(os.path.join(work_dir, "fixture"))
+
+        for case in args.cases:
+            traced = run_case(case, paths, os.path.join(work_dir, case), trace=True)
+            runs = [run_case(case, paths, os.path.join(work_dir, case)) for _ in range(max(args.repeat, 1))]
+            output, comparisons, _ = runs[-1]
+            profile = best_profile(traced[2], [run[2] for run in runs])
+            golden_dir = os.path.join(args.regression_dir, "golden", CASES[case][1])
+            print_profile(case, profile, baselines.get(case, {}))
+
+            if args.update:
+                if CASES[case][1] == case:
+                    save_golden(golden_dir, output, comparisons)
+                baselines[case] = profile
+                continue
+
+            problems = diff_golden(golden_dir, output, comparisons)
+            problems += check_baseline(baselines.get(case, {}), profile, args.time_margin, args.memory_margin, args.rss_margin)
+            failures += [f"[{case}] {problem}" for problem in problems]
+
+    if args.update:
+        os.makedirs(args.regression_dir, exist_ok=True)
+        with open(baselines_path, "w") as f:
+            json.dump(baselines, f, indent=2)
+        print(f"\n=== Updated goldens and baselines in {args.regression_dir} ===")
+        return
+
+    if failures:
+        print(f"\n=== {len(failures)} regression(s) ===")
+        print("\n".join(failures))
+        sys.exit(1)
+    print(f"\n=== {len(args.cases)} case(s) match goldens and baselines ===")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import argparse
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from geojson_writer import dumps, write_geojson
+from precinct_constants import (
+    CVAP_COLUMNS, CVAP_COMPONENTS, FINAL_DIR, HIGH_INCOME_COLUMNS, INCOME_COLUMNS, RACE_COLUMNS, RACE_COMPONENTS, VOTE_COLUMNS,
+)
+
+# ========== CONFIGURABLE VARIABLES ==========
+WORK_CRS = "EPSG:5070"        # Equal-area CRS used to dissolve and simplify counties
+COUNTY_SIMPLIFY_M = 500       # Simplification tolerance for county outlines, in meters
+COUNTY_PRECISION = 4          # Decimal places kept in county outline coordinates
+NUM_CLASSES = 5               # Choropleth classes per metric
+JENKS_SAMPLE = 2000           # Values used for Jenks breaks; larger inputs are sampled evenly
+# ============================================
+
+
+# ---------- METRICS ----------
+def count_columns(frame):
+    return [c for c in VOTE_COLUMNS + RACE_COLUMNS + CVAP_COLUMNS + INCOME_COLUMNS if c in frame.columns]
+
+
+def share(numerator, denominator):
+    denominator = denominator.astype("float64")
+    return (numerator.astype("float64") / denominator.where(denominator > 0)).round(4)
+
+
+def derived_metrics(totals):
+    """Shares used by the choropleths, computed from summed counts so they aggregate correctly."""
+    metrics = pd.DataFrame(index=totals.index)
+    if {"G24PREDHAR", "G24PRERTRU"} <= set(totals.columns):
+        two_party = totals["G24PREDHAR"] + totals["G24PRERTRU"]
+        metrics["HAR_SHARE"] = share(totals["G24PREDHAR"], two_party)
+        metrics["HAR_MARGIN"] = share(totals["G24PREDHAR"] - totals["G24PRERTRU"], two_party)
+    for col in RACE_COMPONENTS:
+        if col in totals.columns:
+            metrics[col.replace("_POP23", "_POP_PCT")] = share(totals[col], totals["TOT_POP23"])
+    for col in CVAP_COMPONENTS:
+        if col in totals.columns:
+            metrics[col.replace("_CVAP23", "_CVAP_PCT")] = share(totals[col], totals["TOT_CVAP23"])
+    high_income = [c for c in HIGH_INCOME_COLUMNS if c in totals.columns]
+    if high_income and "TOT_HOUS23" in totals.columns:
+        metrics["INC_100K_PCT"] = share(totals[high_income].sum(axis=1), totals["TOT_HOUS23"])
+    return metrics
+
+
+def breaks_columns(totals):
+    return [c for c in ["TOT_POP23", "TOT_CVAP23", "TOT_HOUS23"] if c in totals.columns]
+
+
+# ---------- CLASS BREAKS ----------
+def quantile_breaks(values, k=NUM_CLASSES):
+    return np.unique(np.quantile(values, np.linspace(0, 1, k + 1)))
+
+
+def jenks_breaks(values, k=NUM_CLASSES, sample=JENKS_SAMPLE):
+    """
+    Fisher-Jenks natural breaks by dynamic programming over the sorted values.
+
+    Inputs longer than ``sample`` are reduced to evenly spaced order statistics, which
+    keeps the O(k * n^2) search bounded while preserving the distribution's shape.
+    """
+    values = np.sort(values)
+    if len(values) > sample:
+        values = values[np.linspace(0, len(values) - 1, sample).round().astype(int)]
+    if len(np.unique(values)) <= k:
+        return np.unique(values)
+
+    n = len(values)
+    s1 = np.concatenate([[0.0], np.cumsum(values)])
+    s2 = np.concatenate([[0.0], np.cumsum(values ** 2)])
+
+    def ssd(start, end):
+        # Sum of squared deviations of values[start..end] inclusive; start may be an array
+        count = end - start + 1
+        total = s1[end + 1] - s1[start]
+        return s2[end + 1] - s2[start] - total ** 2 / count
+
+    cost = np.full((k, n), np.inf)
+    split = np.zeros((k, n), dtype=int)
+    cost[0] = ssd(np.zeros(n, dtype=int), np.arange(n))
+    for j in range(1, k):
+        for end in range(j, n):
+            starts = np.arange(j, end + 1)
+            candidates = cost[j - 1][starts - 1] + ssd(starts, end)
+            best = int(np.argmin(candidates))
+            cost[j, end] = candidates[best]
+            split[j, end] = starts[best]
+
+    edges = [values[-1]]
+    end = n - 1
+    for j in range(k - 1, 0, -1):
+        start = split[j, end]
+        edges.append(values[start - 1])
+        end = start - 1
+    edges.append(values[0])
+    return np.array(edges[::-1])
+
+
+def class_breaks(metrics, k=NUM_CLASSES):
+    breaks = {}
+    for col in metrics.columns:
+        values = metrics[col].dropna().to_numpy(dtype="float64")
+        if not len(values):
+            continue
+        breaks[col] = {
+            "quantile": [round(float(v), 4) for v in quantile_breaks(values, k)],
+            "jenks": [round(float(v), 4) for v in jenks_breaks(values, k)],
+        }
+    return breaks
+
+
+# ---------- COUNTIES ----------
+def county_keys(precinct, counties=None):
+    """County FIPS for each precinct, from GEOID20 when present or a county layer otherwise."""
+    if "GEOID20" in precinct.columns and precinct["GEOID20"].notna().all():
+        return precinct["GEOID20"].astype(str).str[:5].rename("COUNTY")
+    if counties is None:
+        raise ValueError("Precincts have no GEOID20; pass a county layer to assign counties.")
+    key = "GEOID" if "GEOID" in counties.columns else "GEOID20"
+    points = gpd.GeoDataFrame(geometry=precinct.to_crs(WORK_CRS).representative_point(), index=precinct.index)
+    joined = gpd.sjoin(points, counties.to_crs(WORK_CRS)[[key, "geometry"]], how="left", predicate="within")
+    return joined[~joined.index.duplicated()][key].reindex(precinct.index).rename("COUNTY")
+
+
+def simplify_counties(shapes, tolerance=COUNTY_SIMPLIFY_M):
+    """
+    Simplify county outlines as one coverage so each shared border is simplified once.
+
+    Small slivers in the precinct layer are tolerated; only if the result is invalid are
+    the outlines simplified one by one instead.
+    """
+    simplified = shapely.coverage_simplify(shapes.geometry.values, tolerance)
+    if shapely.is_valid(simplified).all():
+        return gpd.GeoSeries(simplified, index=shapes.index, crs=shapes.crs)
+    print("Warning: county coverage simplification failed, simplifying each county separately.")
+    return shapes.geometry.simplify(tolerance)
+
+
+def to_records(frame):
+    frame = frame.astype(object).where(frame.notna(), None)
+    return {
+        str(key): {col: (v.item() if hasattr(v, "item") else v) for col, v in row.items()}
+        for key, row in frame.iterrows()
+    }
+
+
+# ---------- SIDECARS ----------
+def write_summaries(precinct, state_dir, state, counties=None, k=NUM_CLASSES):
+    """Write county and state aggregates plus class breaks next to a state's final output."""
+    counts = count_columns(precinct)
+    values = pd.DataFrame(precinct[counts]).fillna(0).astype("int64")
+
+    county = county_keys(precinct, counties)
+    county_totals = values.groupby(county).sum()
+    county_metrics = derived_metrics(county_totals)
+    state_totals = values.sum().to_frame(state).T
+    state_metrics = derived_metrics(state_totals)
+
+    precinct_metrics = derived_metrics(values)
+    precinct_metrics[breaks_columns(values)] = values[breaks_columns(values)]
+    county_breaks_input = county_metrics.copy()
+    county_breaks_input[breaks_columns(county_totals)] = county_totals[breaks_columns(county_totals)]
+
+    summary = {
+        "state": state,
+        "precincts": len(precinct),
+        "totals": to_records(pd.concat([state_totals, state_metrics], axis=1))[state],
+        "counties": to_records(pd.concat([county_totals, county_metrics], axis=1)),
+        "breaks": {
+            "precinct": class_breaks(precinct_metrics, k),
+            "county": class_breaks(county_breaks_input, k),
+        },
+    }
+    with open(os.path.join(state_dir, f"{state}_summary.json"), "wb") as f:
+        f.write(dumps(summary))
+
+    county_table = pd.concat([county_totals, county_metrics], axis=1).reset_index(names="COUNTY")
+    county_table.to_parquet(os.path.join(state_dir, f"{state}_county_summary.parquet"), index=False)
+
+    shapes = precinct[["geometry"]].to_crs(WORK_CRS).assign(COUNTY=county.to_numpy()).dissolve(by="COUNTY")
+    outlines = gpd.GeoDataFrame(
+        county_table,
+        geometry=simplify_counties(shapes).reindex(county_table["COUNTY"]).values,
+        crs=WORK_CRS,
+    )
+    write_geojson(outlines, os.path.join(state_dir, f"{state}_county_summary.geojson"), COUNTY_PRECISION)
+    return summary
+
+
+# ---------- MAIN ----------
+def main():
+    parser = argparse.ArgumentParser(description="Write county/state summary sidecars for existing final precinct outputs.")
+    parser.add_argument("states", nargs="+")
+    parser.add_argument("--counties", help="County boundary layer, needed when precincts have no GEOID20")
+    parser.add_argument("--classes", type=int, default=NUM_CLASSES)
+    args = parser.parse_args()
+
+    counties = gpd.read_file(args.counties) if args.counties else None
+    for state in args.states:
+        state_dir = os.path.join(FINAL_DIR, state)
+        precinct = gpd.read_file(os.path.join(state_dir, f"{state}_precinct_all_pop.geojson"))
+        summary = write_summaries(precinct, state_dir, state, counties, args.classes)
+        print(f"=== {state}: {len(summary['counties'])} counties summarized in {state_dir} ===")
+
+
+if __name__ == "__main__":
+    main()